@@ -1,12 +1,54 @@
 # app.py (updated)
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Body, FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
+import asyncio
+import httpx
 import logging
-from typing import Optional
+import os
+from redis import asyncio as aioredis
+from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
+from typing import List, Optional
+from aptos_api import AptosAPI, APTOS_API_URL
 from nft_verifier import NFTVerifier
 
-app = FastAPI()
+# Per-client limit on the verification endpoints, checked before any upstream I/O
+RATE_LIMIT = "30/minute"
+
+# Batch verification bounds. The batch limit keeps owner throughput in line with
+# RATE_LIMIT (3 x 10 = 30 owners/minute).
+MAX_BATCH_OWNERS = 10
+BATCH_RATE_LIMIT = "3/minute"
+# Owners verified at once across all batch requests. Each verification holds up to two
+# upstream connections, so this stays well below the client's 100-connection pool.
+BATCH_CONCURRENCY = 20
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+# Proxies in front of the app that append to X-Forwarded-For (1 for the platform router).
+# Set to 0 when serving clients directly.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+def client_ip(request: Request) -> str:
+    """Rate-limit key: the client address as recorded by our own trusted proxies."""
+    # Clients can send their own X-Forwarded-For and routers append to it, so only the
+    # entries added by our proxies (counted from the right) can be trusted.
+    if TRUSTED_PROXY_HOPS:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+# Counters are kept in memory (per worker): slowapi checks limits synchronously, so a
+# Redis backend would put a blocking round-trip on the event loop for every request.
+limiter = Limiter(key_func=client_ip, storage_uri="memory://")
+app.state.limiter = limiter
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    return JSONResponse({"detail": "rate limited"}, status_code=429)
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -16,15 +58,41 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def read_index():
     return FileResponse("static/index.html")
 
-# Initialize verifier
-nft_verifier = NFTVerifier()
+# Initialized on startup, once the shared HTTP client exists
+nft_verifier: Optional[NFTVerifier] = None
+
+@app.on_event("startup")
+async def startup():
+    global nft_verifier
+    app.state.aptos_client = httpx.AsyncClient(
+        base_url=APTOS_API_URL,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        headers={"accept": "application/json"},
+    )
+    # Redis is optional; without REDIS_URL the Aptos calls are simply not cached
+    redis_url = os.environ.get("REDIS_URL")
+    app.state.redis = aioredis.from_url(redis_url) if redis_url else None
+    nft_verifier = NFTVerifier(AptosAPI(app.state.aptos_client, app.state.redis))
+
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.aptos_client.aclose()
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
 
 @app.get("/verify/owner/{owner_address}")
-async def verify_by_owner(owner_address: str):
+@limiter.limit(RATE_LIMIT)
+async def verify_by_owner(
+    request: Request,
+    owner_address: str,
+    limit: int = Query(25, ge=1, le=100, description="Transactions per page"),
+    max_pages: int = Query(1, ge=1, le=5, description="Maximum transaction pages to scan")
+):
     """Verify NFTs owned by a specific address."""
     try:
         logger.info(f"Verifying NFTs for Owner: {owner_address}")
-        verification_result = nft_verifier.get_nft_data_by_owner(owner_address)
+        verification_result = await nft_verifier.get_nft_data_by_owner(owner_address, limit, max_pages)
         
         if not verification_result.get("nfts"):
             raise HTTPException(status_code=404, detail="No NFTs found for this owner")
@@ -37,8 +105,34 @@ async def verify_by_owner(owner_address: str):
         logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.post("/verify/owners")
+@limiter.limit(BATCH_RATE_LIMIT)
+async def verify_owners(request: Request, owner_addresses: List[str] = Body(...)):
+    """Verify NFTs for several owners concurrently."""
+    if len(owner_addresses) > MAX_BATCH_OWNERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_OWNERS} owner addresses per request")
+    
+    logger.info(f"Verifying NFTs for {len(owner_addresses)} owners")
+    
+    async def verify_one(owner_address: str) -> dict:
+        async with batch_semaphore:
+            return await nft_verifier.get_nft_data_by_owner(owner_address)
+    
+    results = await asyncio.gather(*(verify_one(a) for a in owner_addresses), return_exceptions=True)
+    
+    # A failure for one owner shouldn't fail the whole batch
+    batch = []
+    for owner_address, result in zip(owner_addresses, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error verifying owner {owner_address}: {result}")
+            result = {"owner_address": owner_address, "error": "Internal Server Error"}
+        batch.append(result)
+    return batch
+
 @app.get("/verify/collection")
+@limiter.limit(RATE_LIMIT)
 async def verify_by_collection(
+    request: Request,
     creator_address: str,
     collection_name: str,
     token_id: Optional[str] = Query(None)
@@ -46,7 +140,7 @@ async def verify_by_collection(
     """Verify a collection by creator address and collection name, optionally filtering by token ID."""
     try:
         logger.info(f"Verifying Collection: {collection_name} by Creator: {creator_address}, Token ID: {token_id}")
-        verification_result = nft_verifier.get_nft_data_by_collection(
+        verification_result = await nft_verifier.get_nft_data_by_collection(
             creator_address, collection_name, token_id
         )
         
@@ -62,7 +156,9 @@ async def verify_by_collection(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 @app.get("/verify/nft")
+@limiter.limit(RATE_LIMIT)
 async def verify_single_nft(
+    request: Request,
     owner_address: Optional[str] = Query(None),
     creator_address: Optional[str] = Query(None),
     collection_name: Optional[str] = Query(None),
@@ -74,14 +170,14 @@ async def verify_single_nft(
         
         # Implementation depends on which parameters are provided
         if owner_address:
-            result = nft_verifier.get_nft_data_by_owner(owner_address)
+            result = await nft_verifier.get_nft_data_by_owner(owner_address)
             if token_id and result.get("nfts"):
                 # Filter to specific token if token_id is provided
-                result["nfts"] = [nft for nft in result["nfts"] if str(nft.get("id")) == token_id]
+                result["nfts"] = [nft for nft in result["nfts"] if str(nft.id) == token_id]
             return result
             
         elif creator_address and collection_name:
-            return nft_verifier.get_nft_data_by_collection(creator_address, collection_name)
+            return await nft_verifier.get_nft_data_by_collection(creator_address, collection_name)
             
         else:
             raise HTTPException(
@@ -1,66 +1,183 @@
 # aptos_api.py
-import requests
+import httpx
+import ijson
+from decimal import Decimal
 import logging
-from typing import Dict, List, Optional, Union
+import orjson
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from cache import redis_memoize
 
 # Configure Logging
 logger = logging.getLogger(__name__)
 
+APTOS_API_URL = "https://fullnode.mainnet.aptoslabs.com/v1"
+
+# Transaction fields the verifier reads; everything else is dropped while streaming
+TRANSACTION_FIELDS = ("type", "timestamp", "success", "sequence_number")
+
+class _AsyncByteReader:
+    """Adapts a streamed httpx response to the async file interface ijson reads from."""
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        # ijson probes with read(0) to detect bytes vs str; don't consume a chunk for it
+        if size == 0:
+            return b""
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+# orjson only encodes integers in [-2**63, 2**64); Move u128/u256 values can exceed that
+_ORJSON_INT_MIN = -2**63
+_ORJSON_INT_MAX = 2**64 - 1
+
+def _to_json_types(value):
+    """
+    Make streamed values encodable by orjson, recursively: Decimals (ijson's
+    non-integer numbers) become floats and integers outside the 64-bit range become strings.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, int) and not _ORJSON_INT_MIN <= value <= _ORJSON_INT_MAX:
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _to_json_types(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_json_types(v) for v in value]
+    return value
+
+def _trim_transaction(tx: Dict) -> Dict:
+    trimmed = {field: _to_json_types(tx[field]) for field in TRANSACTION_FIELDS if field in tx}
+    trimmed["events"] = [{"type": e.get("type", "")} for e in tx.get("events", [])]
+    return trimmed
+
 class AptosAPI:
-    def __init__(self, api_url="https://fullnode.mainnet.aptoslabs.com/v1"):
-        self.api_url = api_url
-        self.headers = {"accept": "application/json"}
-    
-    def get_account_resources(self, address: str) -> Optional[List[Dict]]:
-        """Fetch all resources owned by a specific address."""
+    def __init__(self, client: httpx.AsyncClient, redis=None):
+        # Shared client created at app startup so connections are pooled across calls
+        self.client = client
+        # Optional redis.asyncio client used by @redis_memoize
+        self.redis = redis
+
+    async def _stream_items(self, path: str, params: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """Stream the elements of a JSON array response one at a time without buffering the body."""
+        async with self.client.stream("GET", path, params=params) as response:
+            if response.is_error:
+                # Read the body so the error handler can log it
+                await response.aread()
+                response.raise_for_status()
+            # No use_float: the C backend then rejects integers above int64 with "integer overflow"
+            async for item in ijson.items_async(_AsyncByteReader(response), "item"):
+                yield item
+
+    @redis_memoize(ttl=60, key_prefix="aptos:resources")
+    async def get_account_resources(self, address: str, type_keywords: Tuple[str, ...] = ()) -> Optional[List[Dict]]:
+        """
+        Fetch resources owned by a specific address.
+
+        Args:
+            address: Account address
+            type_keywords: If given, only keep resources whose lowercased type
+                contains one of these substrings; the rest are discarded as they stream in
+
+        Returns:
+            List of matching resources, or None on failure
+        """
         try:
-            url = f"{self.api_url}/accounts/{address}/resources"
-            response = requests.get(url, headers=self.headers)
-            
-            if response.status_code != 200:
-                logger.error(f"Failed to fetch account resources: {response.text}")
-                return None
-
-            return response.json()
+            resources = []
+            async for resource in self._stream_items(f"/accounts/{address}/resources"):
+                if type_keywords:
+                    resource_type = resource.get("type", "").lower()
+                    if not any(keyword in resource_type for keyword in type_keywords):
+                        continue
+                resources.append(_to_json_types(resource))
+            return resources
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Failed to fetch account resources: {e.response.text}")
+            return None
         except Exception as e:
             logger.exception(f"Error fetching account resources: {str(e)}")
             return None
-    
-    def get_account_transactions(self, address: str, limit: int = 25) -> Optional[List[Dict]]:
-        """Fetch recent transactions for an address."""
+
+    @redis_memoize(ttl=60, key_prefix="aptos:transactions")
+    async def get_account_transactions(self, address: str, limit: int = 25, max_pages: int = 1) -> Optional[List[Dict]]:
+        """
+        Fetch recent transactions for an address, paging backwards from the latest.
+
+        Args:
+            address: Account address
+            limit: Page size (the node caps this at 100)
+            max_pages: Maximum number of pages to fetch
+
+        Returns:
+            Up to limit * max_pages transactions in ascending sequence order,
+            or None if any page could not be fetched
+        """
+        transactions: List[Dict] = []
+        params = {"limit": limit}
         try:
-            url = f"{self.api_url}/accounts/{address}/transactions?limit={limit}"
-            response = requests.get(url, headers=self.headers)
-            
-            if response.status_code != 200:
-                logger.error(f"Failed to fetch transactions: {response.text}")
-                return None
-
-            return response.json()
+            for _ in range(max_pages):
+                page = [
+                    _trim_transaction(tx)
+                    async for tx in self._stream_items(f"/accounts/{address}/transactions", params)
+                ]
+                transactions[:0] = page
+
+                # A short page means we've reached the account's first transaction
+                if len(page) < params["limit"]:
+                    break
+                oldest_sequence = int(page[0].get("sequence_number", 0))
+                if oldest_sequence == 0:
+                    break
+                params = {"start": max(oldest_sequence - limit, 0), "limit": min(limit, oldest_sequence)}
+
+            return transactions
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Failed to fetch transactions: {e.response.text}")
+            return None
         except Exception as e:
             logger.exception(f"Error fetching transactions: {str(e)}")
             return None
-    
-    def get_collection_data(self, creator_address: str, collection_name: str) -> Optional[Dict]:
+
+    @redis_memoize(ttl=600, key_prefix="aptos:collection")
+    async def get_collection_data(self, creator_address: str, collection_name: str) -> Optional[Dict]:
         """Fetch data for a specific collection."""
         try:
             # This endpoint may vary based on Aptos implementation
-            url = f"{self.api_url}/accounts/{creator_address}/resource/0x3::token::Collections"
-            response = requests.get(url, headers=self.headers)
-            
-            if response.status_code != 200:
-                logger.error(f"Failed to fetch collection data: {response.text}")
-                return None
-
-            collections_data = response.json().get("data", {}).get("collections", {})
-            
+            response = await self.client.get(
+                f"/accounts/{creator_address}/resource/0x3::token::Collections"
+            )
+            response.raise_for_status()
+
+            collections_data = orjson.loads(response.content).get("data", {}).get("collections", {})
+
             # Find the specified collection
             for collection in collections_data.values():
                 if collection.get("name") == collection_name:
                     return collection
-                    
+
             logger.info(f"Collection '{collection_name}' not found for creator {creator_address}")
             return None
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Failed to fetch collection data: {e.response.text}")
+            return None
         except Exception as e:
             logger.exception(f"Error fetching collection data: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    @redis_memoize(ttl=600, key_prefix="aptos:collection_index", key_params=("creator_address", "collection_name"))
+    async def get_collection_token_index(self, creator_address: str, collection_name: str, tokens: List[Dict]) -> Dict[str, int]:
+        """
+        Map token ids to their position in a collection's `tokens` list.
+
+        Memoized under the collection's identity (not the tokens themselves) so the
+        index is built at most once per TTL, separately from the collection payload.
+        Positions can go stale if the collection changes, so callers should check the
+        token found at a position.
+        """
+        index: Dict[str, int] = {}
+        for position, token in enumerate(tokens):
+            index.setdefault(str(token.get("id")), position)
+        return index
@@ -0,0 +1,98 @@
+# cache.py
+import asyncio
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+from typing import Any, Callable, Optional, Tuple
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Soft lock settings used to stop concurrent misses on a cold key all hitting the upstream API
+LOCK_TTL = 10
+LOCK_WAIT_INTERVAL = 0.05
+LOCK_WAIT_STEPS = 40
+
+def _make_key(key_prefix: str, signature: inspect.Signature, args: tuple, kwargs: dict,
+              key_params: Optional[Tuple[str, ...]] = None) -> str:
+    # Bind to the signature with defaults applied so f(a) and f(a, limit=25) share a key
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    arguments.pop("self", None)
+    if key_params is not None:
+        arguments = {name: arguments[name] for name in key_params}
+    digest = hashlib.sha1(json.dumps(arguments, sort_keys=True).encode()).hexdigest()
+    return f"{key_prefix}:{digest}"
+
+def _encode(value: Any) -> bytes:
+    return gzip.compress(json.dumps(value).encode())
+
+def _decode(payload: bytes) -> Any:
+    return json.loads(gzip.decompress(payload))
+
+async def _safe_get(redis, key: str) -> Optional[bytes]:
+    try:
+        return await redis.get(key)
+    except Exception as e:
+        logger.warning(f"Redis GET failed for {key}: {e}")
+        return None
+
+def redis_memoize(ttl: int, key_prefix: str, key_params: Optional[Tuple[str, ...]] = None) -> Callable:
+    """
+    Cache the JSON result of an async method in Redis for `ttl` seconds.
+
+    The instance the method is bound to must expose a `redis` attribute; when it
+    is None, or Redis is unreachable, the call goes straight to the wrapped method.
+    None results are treated as failures and never cached. `key_params` restricts
+    the cache key to the named parameters (all of them by default).
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            redis = getattr(self, "redis", None)
+            if redis is None:
+                return await func(self, *args, **kwargs)
+
+            key = _make_key(key_prefix, signature, (self,) + args, kwargs, key_params)
+            cached = await _safe_get(redis, key)
+            if cached is not None:
+                return _decode(cached)
+
+            lock_key = f"{key}:lock"
+            try:
+                have_lock = await redis.set(lock_key, 1, nx=True, ex=LOCK_TTL)
+            except Exception as e:
+                logger.warning(f"Redis lock failed for {key}: {e}")
+                have_lock = False
+            else:
+                if not have_lock:
+                    # Another caller is already fetching this key; wait briefly for its result
+                    for _ in range(LOCK_WAIT_STEPS):
+                        await asyncio.sleep(LOCK_WAIT_INTERVAL)
+                        cached = await _safe_get(redis, key)
+                        if cached is not None:
+                            return _decode(cached)
+
+            try:
+                result = await func(self, *args, **kwargs)
+                if result is not None:
+                    try:
+                        await redis.setex(key, ttl, _encode(result))
+                    except Exception as e:
+                        logger.warning(f"Redis SETEX failed for {key}: {e}")
+                return result
+            finally:
+                if have_lock:
+                    try:
+                        await redis.delete(lock_key)
+                    except Exception as e:
+                        logger.warning(f"Redis lock release failed for {key}: {e}")
+
+        return wrapper
+    return decorator
@@ -1,7 +1,12 @@
+from functools import lru_cache
+
 known_scammers = set()
 
 def add_scammer(address):
     known_scammers.add(address)
+    # Invalidate the cached snapshot so lookups see the new address
+    get_known_scammers.cache_clear()
 
+@lru_cache(maxsize=1)
 def get_known_scammers():
-    return known_scammers
+    return frozenset(known_scammers)
@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
 
+import ciso8601
+
 def analyze_nft_risk(nft_data, transaction_history, known_scammers):
     risk_score = 0
     risk_factors = []
@@ -13,7 +15,7 @@ def analyze_nft_risk(nft_data, transaction_history, known_scammers):
         risk_score += 20 * (transfer_count - 3)
         risk_factors.append("HIGH_TRANSFER_VELOCITY")
 
-    if datetime.fromisoformat(nft_data['created_at']) > datetime.now() - timedelta(days=30):
+    if ciso8601.parse_datetime(nft_data['created_at']) > datetime.now() - timedelta(days=30):
         risk_score += 15
         risk_factors.append("NEW_ACCOUNT")
 
@@ -24,5 +26,4 @@ def analyze_nft_risk(nft_data, transaction_history, known_scammers):
     }
 
 def verify_nft_metadata(nft_data):
-    expected_fields = {"name", "image", "description"}
-    return all(field in nft_data for field in expected_fields)
+    return "name" in nft_data and "image" in nft_data and "description" in nft_data
@@ -1,78 +1,126 @@
 # nft_verifier.py
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
+import asyncio
 import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+import anyio
+import anyio.to_thread
+import ciso8601
+
 from aptos_api import AptosAPI
 from db import get_known_scammers
 
 # Configure Logging
 logger = logging.getLogger(__name__)
 
+# Activity keywords matched against transaction/event types in one regex pass.
+# The lookahead lets overlapping keywords (e.g. "swaproperty") both match.
+_ACTIVITY_RE = re.compile(r"(?=(stake|swap|list|deposit|withdraw|property))")
+
+# Last "::" segment inside the first generic parameter, e.g. "AptosCoin" in
+# "0x1::coin::CoinStore<0x1::aptos_coin::AptosCoin>"
+_TOKEN_NAME_RE = re.compile(r"[^<]*<[^<>]*::([^<>]*)")
+
+# Transfer velocity is scored over the latest transactions only, so the verdict doesn't
+# depend on how deep the caller asked to scan the history
+RISK_TX_WINDOW = 25
+
+def _first(data: Dict, *keys: str, default: Any = "N/A") -> Any:
+    """Return the value of the first key present in data, probing later keys only on a miss."""
+    for key in keys:
+        if key in data:
+            return data[key]
+    return default
+
+def _result_or_none(result: Any, description: str) -> Any:
+    """Unwrap an asyncio.gather result, logging and discarding exceptions."""
+    if isinstance(result, BaseException):
+        logger.error(f"Error fetching {description}: {result}")
+        return None
+    return result
+
+@dataclass(slots=True)
+class FormattedNFT:
+    """An owned NFT in the shape the frontend expects; serialized by FastAPI at the response boundary."""
+    name: str
+    id: Any
+    collection: Any
+    creator: Any
+    metadata: Dict  # All raw resource data, kept for reference
+    resource_type: str
+    uri: Optional[str] = None
+    description: Optional[str] = None
+
 class NFTVerifier:
-    def __init__(self):
-        self.aptos_api = AptosAPI()
-        self.known_scammers = get_known_scammers()
+    def __init__(self, aptos_api: AptosAPI):
+        self.aptos_api = aptos_api
+        # Dedicated worker pool for CPU-bound verification, so it can't starve the default
+        # thread pool Starlette uses for file responses and sync code. Must be created
+        # inside the event loop (the app builds the verifier on startup).
+        self.cpu_limiter = anyio.CapacityLimiter((os.cpu_count() or 1) * 2)
     
-    def get_nft_data_by_owner(self, owner_address: str) -> Dict:
-        """Fetch and verify all NFTs owned by an address."""
-        resources = self.aptos_api.get_account_resources(owner_address)
+    @property
+    def known_scammers(self) -> frozenset:
+        # Cached frozenset from db; rebuilt only when a scammer is added
+        return get_known_scammers()
+    
+    async def get_nft_data_by_owner(self, owner_address: str, tx_limit: int = 25, tx_max_pages: int = 1) -> Dict:
+        """Fetch and verify all NFTs owned by an address, scanning up to tx_limit * tx_max_pages transactions."""
+        # Resources and transaction history are independent, so fetch them concurrently
+        resources, tx_history = await asyncio.gather(
+            self.aptos_api.get_account_resources(owner_address, type_keywords=("coin", "token")),
+            self.aptos_api.get_account_transactions(owner_address, limit=tx_limit, max_pages=tx_max_pages),
+            return_exceptions=True
+        )
+        resources = _result_or_none(resources, "account resources")
+        tx_history = _result_or_none(tx_history, "transactions")
+        now = datetime.now()
         if not resources:
-            return {"nfts": [], "is_verified": False, "reason": "No resources found"}
+            return {"owner_address": owner_address, "nfts": [], "is_verified": False, "reason": "No resources found"}
         
-        # Parse NFTs
+        # Parse NFTs and token/coin balances in a single pass over the resources
         nfts = []
+        token_balances = []
         for resource in resources:
-            if "token" in resource.get("type", ""):
-                raw_data = resource.get("data", {})
-                
+            rtype = resource.get("type", "")
+            rtype_l = rtype.lower()
+            is_nft = "token" in rtype
+            if not is_nft and "coin" not in rtype_l and "token" not in rtype_l:
+                continue
+            raw_data = resource.get("data", {})
+            
+            if is_nft:
                 # Log the raw data structure for debugging
                 logger.debug(f"Raw NFT data: {raw_data}")
                 
                 # Extract and format NFT data to match frontend expectations
-                formatted_nft = {
-                    "name": raw_data.get("name", "Unnamed NFT"),
-                    "id": raw_data.get("token_id", raw_data.get("id", "N/A")),
-                    "collection": raw_data.get("collection_name", raw_data.get("collection", "N/A")),
-                    "creator": raw_data.get("creator_address", raw_data.get("creator", "N/A")),
-                    "metadata": raw_data,  # Keep all raw data in metadata for reference
-                }
-                
-                # Include any additional fields from the original data
-                formatted_nft["resource_type"] = resource.get("type")
-                
-                # Add URI if available
-                if "uri" in raw_data:
-                    formatted_nft["uri"] = raw_data["uri"]
-                
-                # Add description if available
-                if "description" in raw_data:
-                    formatted_nft["description"] = raw_data["description"]
-                
-                nfts.append(formatted_nft)
-        
-        # Parse token/coin balances
-        token_balances = []
-        for resource in resources:
-            if "coin" in resource.get("type", "").lower() or "token" in resource.get("type", "").lower():
-                raw_data = resource.get("data", {})
-                if "value" in raw_data or "amount" in raw_data:
-                    token_name = self._extract_token_name(resource.get("type", ""))
-                    token_balance = {
-                        "name": token_name,
-                        "amount": raw_data.get("value", raw_data.get("amount", 0)),
-                        "resource_type": resource.get("type", "")
-                    }
-                    token_balances.append(token_balance)
-        
-        # Get transaction history for risk analysis and activity parsing
-        tx_history = self.aptos_api.get_account_transactions(owner_address)
-        
-        # Parse account activities
-        account_activities = self._parse_account_activities(tx_history)
+                nfts.append(FormattedNFT(
+                    name=raw_data.get("name", "Unnamed NFT"),
+                    id=_first(raw_data, "token_id", "id"),
+                    collection=_first(raw_data, "collection_name", "collection"),
+                    creator=_first(raw_data, "creator_address", "creator"),
+                    metadata=raw_data,
+                    resource_type=rtype,
+                    uri=raw_data.get("uri"),
+                    description=raw_data.get("description")
+                ))
+            
+            if "value" in raw_data or "amount" in raw_data:
+                token_balances.append({
+                    "name": self._extract_token_name(rtype),
+                    "amount": _first(raw_data, "value", "amount", default=0),
+                    "resource_type": rtype
+                })
         
-        # Create verification result
-        verification_result = self._verify_nfts(nfts, tx_history)
+        # Activity parsing and risk scoring are pure CPU work; run them off the event loop
+        account_activities, verification_result = await anyio.to_thread.run_sync(
+            self._compute_activities_and_risk, nfts, tx_history, now, limiter=self.cpu_limiter
+        )
         
         # Compile the complete account information
         account_info = {
@@ -90,7 +138,7 @@ class NFTVerifier:
         
         return account_info
     
-    def get_nft_data_by_collection(self, creator_address: str, collection_name: str, token_id: Optional[str] = None) -> Dict:
+    async def get_nft_data_by_collection(self, creator_address: str, collection_name: str, token_id: Optional[str] = None) -> Dict:
         """
         Fetch and verify NFTs for a specific collection, optionally filtering by token ID.
         
@@ -102,7 +150,15 @@ class NFTVerifier:
         Returns:
             Dictionary containing collection data and verification results
         """
-        collection_data = self.aptos_api.get_collection_data(creator_address, collection_name)
+        # Creator transaction history doesn't depend on the collection lookup
+        collection_data, tx_history = await asyncio.gather(
+            self.aptos_api.get_collection_data(creator_address, collection_name),
+            self.aptos_api.get_account_transactions(creator_address),
+            return_exceptions=True
+        )
+        collection_data = _result_or_none(collection_data, "collection data")
+        tx_history = _result_or_none(tx_history, "transactions")
+        now = datetime.now()
         if not collection_data:
             return {"collection_data": None, "is_verified": False, "reason": "Collection not found"}
         
@@ -112,7 +168,7 @@ class NFTVerifier:
             for item in collection_data["items"]:
                 formatted_item = {
                     "name": item.get("name", "Unnamed Item"),
-                    "id": item.get("token_id", item.get("id", "N/A")),
+                    "id": _first(item, "token_id", "id"),
                     "owner": item.get("owner", "N/A"),
                     "metadata": item  # Keep the original data
                 }
@@ -120,30 +176,26 @@ class NFTVerifier:
             
             collection_data["items"] = formatted_items
         
-        # Get transaction history for risk analysis
-        tx_history = self.aptos_api.get_account_transactions(creator_address)
-        
         verification_result = {
             "creator_address": creator_address,
             "collection_name": collection_name,
             "collection_data": collection_data,
             "is_scammer": creator_address in self.known_scammers,
-            "verification_results": self._verify_collection(collection_data, tx_history)
+            "verification_results": self._verify_collection(collection_data, tx_history, now)
         }
         
         # If token_id is provided, filter collection tokens to get the specific one
         if token_id:
             logger.info(f"Filtering collection for token ID: {token_id}")
-            tokens = collection_data.get("tokens", [])
-            filtered_tokens = [token for token in tokens if str(token.get("id")) == token_id]
+            token_data = await self._find_collection_token(
+                creator_address, collection_name, collection_data.get("tokens", []), token_id
+            )
             
-            if filtered_tokens:
-                token_data = filtered_tokens[0]
-                
+            if token_data is not None:
                 # Format token data
                 formatted_token = {
                     "name": token_data.get("name", "Unnamed Token"),
-                    "id": token_data.get("token_id", token_data.get("id", "N/A")),
+                    "id": _first(token_data, "token_id", "id"),
                     "owner": token_data.get("owner", "N/A"),
                     "creator": creator_address,
                     "collection": collection_name,
@@ -152,7 +204,7 @@ class NFTVerifier:
                 
                 verification_result["token_data"] = formatted_token
                 # Add token-specific verification
-                token_risk = self._analyze_nft_risk(formatted_token, tx_history)
+                token_risk = self._analyze_nft_risk(formatted_token, self._count_nft_transfers(tx_history))
                 verification_result["token_verification"] = {
                     "risk_assessment": token_risk,
                     "is_verified": not token_risk["is_high_risk"]
@@ -168,23 +220,37 @@ class NFTVerifier:
         
         return verification_result
     
+    async def _find_collection_token(self, creator_address: str, collection_name: str, tokens: List[Dict], token_id: str) -> Optional[Dict]:
+        """Find a collection token by id via the cached id -> position index."""
+        if not isinstance(tokens, list):
+            return None
+        
+        index = await self.aptos_api.get_collection_token_index(creator_address, collection_name, tokens)
+        position = index.get(token_id)
+        if position is not None and position < len(tokens) and str(tokens[position].get("id")) == token_id:
+            return tokens[position]
+        
+        # Missing or stale index entry (the collection may have changed since); fall back to a scan
+        return next((token for token in tokens if str(token.get("id")) == token_id), None)
+    
+    def _compute_activities_and_risk(self, nfts: List[FormattedNFT], tx_history: Optional[List[Dict]], now: datetime) -> Tuple[Dict, Dict]:
+        """Parse account activities and verify NFTs; runs in a worker thread."""
+        account_activities = self._parse_account_activities(tx_history or [])
+        verification_result = self._verify_nfts(nfts, tx_history, now)
+        return account_activities, verification_result
+    
     def _extract_token_name(self, resource_type: str) -> str:
         """Extract token name from resource type string."""
         # Example: "0x1::coin::CoinStore<0x1::aptos_coin::AptosCoin>" -> "AptosCoin"
-        try:
-            if "<" in resource_type and ">" in resource_type:
-                inside_brackets = resource_type.split("<")[1].split(">")[0]
-                if "::" in inside_brackets:
-                    return inside_brackets.split("::")[-1]
+        match = _TOKEN_NAME_RE.match(resource_type)
+        if match and ">" in resource_type:
+            return match.group(1)
+        
+        parts = resource_type.split("::")
+        if len(parts) >= 3:
+            return parts[2].split("<")[0]
             
-            parts = resource_type.split("::")
-            if len(parts) >= 3:
-                return parts[2].split("<")[0]
-                
-            return resource_type.split("::")[-1]
-        except Exception as e:
-            logger.error(f"Error extracting token name from {resource_type}: {e}")
-            return resource_type
+        return parts[-1]
     
     def _parse_account_activities(self, tx_history: List[Dict]) -> Dict:
         """Parse account activities from transaction history."""
@@ -202,52 +268,64 @@ class NFTVerifier:
             "recent_transactions": []
         }
         
-        # Process each transaction to identify activities
+        recent = activities["recent_transactions"]
+        event_counts = Counter()
+        swap_count = 0
+        listing_count = 0
+        
+        # Process each transaction to identify activities, visiting every event once
         for tx in tx_history:
-            tx_type = tx.get("type", "").lower()
-            events = tx.get("events", [])
+            tx_keywords = set(_ACTIVITY_RE.findall(tx.get("type", "").lower()))
             
-            # Check for NFT staking
-            if "stake" in tx_type or any("stake" in e.get("type", "").lower() for e in events):
-                activities["nft_staking"] = True
-                
-            # Count token swaps
-            if "swap" in tx_type or any("swap" in e.get("type", "").lower() for e in events):
-                activities["token_swaps"]["swap_count"] += 1
-                
-            # Count listings
-            if "list" in tx_type or any("list" in e.get("type", "").lower() for e in events):
-                activities["token_swaps"]["listing_count"] += 1
-                
-            # Count NFT transfers
-            for event in events:
-                event_type = event.get("type", "").lower()
-                if "deposit" in event_type:
-                    activities["nft_transfers"]["deposit_count"] += 1
-                if "withdraw" in event_type:
-                    activities["nft_transfers"]["withdraw_count"] += 1
-                    
-            # Count property modifications
-            property_events = [e for e in events if "property" in e.get("type", "").lower()]
-            activities["property_modifications"] += len(property_events)
+            for event in tx.get("events", []):
+                event_keywords = set(_ACTIVITY_RE.findall(event.get("type", "").lower()))
+                if event_keywords:
+                    event_counts.update(event_keywords)
+                    tx_keywords |= event_keywords
             
-            # Add to recent transactions (limit to 5)
-            if len(activities["recent_transactions"]) < 5:
-                activities["recent_transactions"].append({
-                    "type": tx.get("type", "Unknown"),
-                    "timestamp": tx.get("timestamp", ""),
-                    "success": tx.get("success", True)
-                })
+            # Staking is a flag; swaps and listings count once per transaction
+            if "stake" in tx_keywords:
+                activities["nft_staking"] = True
+            if "swap" in tx_keywords:
+                swap_count += 1
+            if "list" in tx_keywords:
+                listing_count += 1
+        
+        # History is in ascending order, so the most recent 5 are at the tail; list newest first
+        for tx in reversed(tx_history[-5:]):
+            recent.append({
+                "type": tx.get("type", "Unknown"),
+                "timestamp": tx.get("timestamp", ""),
+                "success": tx.get("success", True)
+            })
+        
+        activities["token_swaps"]["swap_count"] = swap_count
+        activities["token_swaps"]["listing_count"] = listing_count
+        activities["nft_transfers"]["deposit_count"] = event_counts["deposit"]
+        activities["nft_transfers"]["withdraw_count"] = event_counts["withdraw"]
+        activities["property_modifications"] = event_counts["property"]
         
         return activities
     
-    def _verify_nfts(self, nfts: List[Dict], tx_history: Optional[List[Dict]]) -> Dict:
+    def _verify_nfts(self, nfts: List[FormattedNFT], tx_history: Optional[List[Dict]], now: datetime) -> Dict:
         """Verify authenticity of a list of NFTs."""
+        # Transfer detection doesn't depend on the NFT, so count once for the whole list
+        transfer_count = self._count_nft_transfers(tx_history)
+        
+        # Common case: no transfer penalty and complete metadata means every score is 0
+        if transfer_count <= 3 and all(self._verify_nft_metadata(nft) for nft in nfts):
+            return {
+                "average_risk_score": 0,
+                "questionable_nfts": [],
+                "is_verified": True,
+                "verification_timestamp": now.isoformat()
+            }
+        
         risk_scores = []
         questionable_nfts = []
         
         for nft in nfts:
-            risk_result = self._analyze_nft_risk(nft, tx_history)
+            risk_result = self._analyze_nft_risk(nft, transfer_count)
             risk_scores.append(risk_result["risk_score"])
             
             if risk_result["is_high_risk"]:
@@ -260,10 +338,10 @@ class NFTVerifier:
             "average_risk_score": sum(risk_scores) / len(risk_scores) if risk_scores else 0,
             "questionable_nfts": questionable_nfts,
             "is_verified": not questionable_nfts,
-            "verification_timestamp": datetime.now().isoformat()
+            "verification_timestamp": now.isoformat()
         }
     
-    def _verify_collection(self, collection_data: Dict, tx_history: Optional[List[Dict]]) -> Dict:
+    def _verify_collection(self, collection_data: Dict, tx_history: Optional[List[Dict]], now: datetime) -> Dict:
         """Verify authenticity of a collection."""
         # Check for common signs of copied/fake collections
         risk_factors = []
@@ -271,12 +349,14 @@ class NFTVerifier:
         
         # Check account age (if transaction history available)
         if tx_history:
-            oldest_tx = min(tx_history, key=lambda x: x.get("timestamp", datetime.now().isoformat()))
-            account_age_days = (datetime.now() - datetime.fromisoformat(oldest_tx.get("timestamp"))).days
-            
-            if account_age_days < 30:
-                risk_score += 25
-                risk_factors.append("NEW_CREATOR_ACCOUNT")
+            # ISO timestamps sort lexicographically, so compare the raw strings
+            oldest_timestamp = min((tx.get("timestamp") for tx in tx_history if tx.get("timestamp")), default=None)
+            if oldest_timestamp:
+                account_age_days = (now - ciso8601.parse_datetime(oldest_timestamp)).days
+                
+                if account_age_days < 30:
+                    risk_score += 25
+                    risk_factors.append("NEW_CREATOR_ACCOUNT")
         
         # Check supply metrics
         supply = collection_data.get("supply", 0)
@@ -299,11 +379,11 @@ class NFTVerifier:
             "risk_factors": risk_factors,
             "is_high_risk": is_high_risk,
             "is_verified": not is_high_risk,
-            "verification_timestamp": datetime.now().isoformat()
+            "verification_timestamp": now.isoformat()
         }
     
-    def _analyze_nft_risk(self, nft_data: Dict, tx_history: Optional[List[Dict]]) -> Dict:
-        """Analyze risk factors for a single NFT."""
+    def _analyze_nft_risk(self, nft_data: Union[FormattedNFT, Dict], transfer_count: int) -> Dict:
+        """Analyze risk factors for a single NFT given its precomputed transfer count."""
         risk_score = 0
         risk_factors = []
         
@@ -312,13 +392,10 @@ class NFTVerifier:
             risk_score += 40
             risk_factors.append("INCOMPLETE_METADATA")
         
-        # Check transfer patterns if transaction history is available
-        if tx_history:
-            # Count NFT transfers
-            transfer_count = sum(1 for tx in tx_history if self._is_nft_transfer(tx, nft_data))
-            if transfer_count > 3:
-                risk_score += 20 * (transfer_count - 3)
-                risk_factors.append("HIGH_TRANSFER_VELOCITY")
+        # Check transfer patterns
+        if transfer_count > 3:
+            risk_score += 20 * (transfer_count - 3)
+            risk_factors.append("HIGH_TRANSFER_VELOCITY")
         
         return {
             "risk_score": risk_score,
@@ -326,31 +403,36 @@ class NFTVerifier:
             "is_high_risk": risk_score >= 70
         }
     
-    def _verify_nft_metadata(self, nft_data: Dict) -> bool:
+    def _verify_nft_metadata(self, nft_data: Union[FormattedNFT, Dict]) -> bool:
         """Check if NFT has complete metadata."""
-        # Adjust these fields based on Aptos NFT structure
-        # For the formatted data in our application
-        basic_fields = ["name", "id"]  # These should be present in our formatted data
+        if isinstance(nft_data, FormattedNFT):
+            # Formatted NFTs always have a name and id; only the raw metadata can be incomplete
+            original_metadata = nft_data.metadata
+            return "uri" in original_metadata or "description" in original_metadata
         
-        # Check if basic fields exist
-        if not all(field in nft_data for field in basic_fields):
+        # Adjust these fields based on Aptos NFT structure
+        # Check if basic fields exist (these should be present in our formatted data)
+        if not ("name" in nft_data and "id" in nft_data):
             return False
             
-        # The original metadata might have different requirements
+        # The original metadata needs at least a uri or a description
         if "metadata" in nft_data:
             original_metadata = nft_data["metadata"]
-            expected_fields = {"uri", "description"}
-            if not any(field in original_metadata for field in expected_fields):
-                return False
+            return "uri" in original_metadata or "description" in original_metadata
                 
         return True
     
-    def _is_nft_transfer(self, tx: Dict, nft_data: Dict) -> bool:
-        """Check if a transaction is a transfer for the specified NFT."""
+    def _count_nft_transfers(self, tx_history: Optional[List[Dict]]) -> int:
+        """Count transfer transactions among the latest RISK_TX_WINDOW (0 when unavailable)."""
+        if not tx_history:
+            return 0
+        # History is in ascending order, so the latest transactions are at the tail
+        return sum(1 for tx in tx_history[-RISK_TX_WINDOW:] if self._is_nft_transfer(tx))
+    
+    def _is_nft_transfer(self, tx: Dict) -> bool:
+        """Check if a transaction is an NFT transfer."""
         # Logic to identify NFT transfers in transaction data
-        # This will need adjustment based on Aptos transaction format
-        if "transfer" not in tx.get("type", "").lower():
-            return False
-            
-        # Additional checks could compare token IDs, collection names, etc.
-        return True
\ No newline at end of file
+        # This will need adjustment based on Aptos transaction format.
+        # Per-NFT checks (token IDs, collection names, etc.) would have to move
+        # back into the per-NFT loop in _verify_nfts.
+        return "transfer" in tx.get("type", "").lower()
\ No newline at end of file